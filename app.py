@@ -1,54 +1,106 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, has_request_context
 from flask_session import Session
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from database import db, User, Service, Menu, Cart, Order, OrderItem
-from datetime import datetime
+from sqlalchemy import event, insert
+from sqlalchemy.orm import undefer
+from sqlalchemy.dialects import postgresql, sqlite
+from database import db, User, Service, Menu, Cart, Order, OrderItem, Asset, ITEM_TYPES, PAYMENT_MODES
+from config import Config
 import os
 from PIL import Image
+from cachetools import TTLCache
+import hashlib
 import io
+import threading
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///user_app.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['UPLOAD_FOLDER'] = 'static/uploads/profile_pics'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+class UserApp(Flask):
+    def get_send_file_max_age(self, filename):
+        # Uploaded pictures are named after their content, so they never change
+        upload_dir = os.path.relpath(self.config['UPLOAD_FOLDER'], self.static_folder)
+        if filename and filename.startswith(upload_dir + '/'):
+            return 365 * 24 * 60 * 60
+        return super().get_send_file_max_age(filename)
 
-# Allowed extensions for images
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+app = UserApp(__name__)
+app.config.from_object(Config)
 
 # Initialize extensions
 db.init_app(app)
 Session(app)
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    _, dot, ext = filename.rpartition('.')
+    return bool(dot) and ext.lower() in app.config['ALLOWED_EXTENSIONS']
+
+def cart_total(cart_items):
+    return sum(item.product.final_price * item.quantity
+               for item in cart_items if item.product)
+
+# Active catalog rows, shared by every request in this worker until the TTL expires
+catalog_cache = TTLCache(maxsize=2, ttl=app.config['CATALOG_CACHE_TTL'])
+catalog_lock = threading.Lock()
+
+def get_cached_catalog(key, query):
+    with catalog_lock:
+        rows = catalog_cache.get(key)
+    if rows is None:
+        rows = query.all()
+        # Detach so later commits can't expire the shared instances
+        for row in rows:
+            db.session.expunge(row)
+        with catalog_lock:
+            catalog_cache[key] = rows
+    return rows
+
+def get_active_services():
+    return get_cached_catalog('services', Service.query.options(
+        undefer(Service.short_description)).filter_by(status='active').order_by(Service.final_price))
+
+def get_active_menu():
+    return get_cached_catalog('menu', Menu.query.options(
+        undefer(Menu.description)).filter_by(status='active').order_by(Menu.final_price))
+
+def invalidate_catalog():
+    # Call after any write to services or menu_items
+    with catalog_lock:
+        catalog_cache.clear()
 
 def save_profile_pic(file):
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Add timestamp to make filename unique
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{filename}"
-        
         # Create directory if not exists
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         
-        # Save file
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Resize straight from the upload stream
+        width, height = app.config['PROFILE_PIC_SIZE']
+        img = Image.open(file.stream)
+        # Let libjpeg scale down while decoding; keep 2x the target for the final resample
+        img.draft('RGB', (width * 2, height * 2))
+        img.thumbnail((width, height), Image.Resampling.BILINEAR)
+        
+        # Re-encode everything as WebP, keeping alpha only where the upload has it
+        if img.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, 'WEBP', quality=80, method=6)
+        data = buffer.getvalue()
         
-        # Resize image if needed
-        img = Image.open(filepath)
-        img.thumbnail((300, 300))
-        img.save(filepath)
+        # Identical uploads share one asset; its content-named URL can be cached forever
+        digest = hashlib.sha256(data).hexdigest()
+        asset = Asset.query.filter_by(sha256=digest).first()
+        if not asset:
+            asset = Asset(filename=f"{digest[:16]}.webp", sha256=digest,
+                          width=img.width, height=img.height)
+            db.session.add(asset)
         
-        return filename
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], asset.filename)
+        if not os.path.exists(filepath):
+            with open(filepath, 'wb') as f:
+                f.write(data)
+        
+        return asset
     return None
 
-# Create tables
+# Create tables (create_all can't alter existing ones; run upgrade_schema.py on older databases)
 with app.app_context():
     db.create_all()
 
@@ -62,6 +114,44 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def session_user(user):
+    # Subset of the user row that templates render as current_user
+    return {
+        'id': user.id,
+        'full_name': user.full_name,
+        'profile_pic': user.profile_pic.filename if user.profile_pic else None,
+        'email': user.email
+    }
+
+# Template context
+@app.context_processor
+def inject_user():
+    if 'user_id' not in session:
+        return dict(current_user=None)
+    if 'user' not in session:
+        session['user'] = session_user(User.query.get(session['user_id']))
+    return dict(current_user=session['user'])
+
+@app.context_processor
+def cart_count():
+    if 'user_id' not in session:
+        return dict(cart_count=0)
+    # Cached in the session; add_to_cart/remove_from_cart/place_order keep it current
+    if 'cart_count' not in session:
+        session['cart_count'] = Cart.query.filter_by(user_id=session['user_id']).count()
+    return dict(cart_count=session['cart_count'])
+
+READ_ONLY_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+@event.listens_for(db.session, 'do_orm_execute')
+def autocommit_reads(orm_execute_state):
+    # Read-only requests never open a transaction, so teardown has nothing to roll back.
+    # Checked on the first statement only, so pages without queries never touch the pool.
+    session_ = orm_execute_state.session
+    if (has_request_context() and request.method in READ_ONLY_METHODS
+            and not session_.in_transaction()):
+        session_.connection(execution_options={'isolation_level': 'AUTOCOMMIT'})
+
 # ========== ROUTES ==========
 
 @app.route('/')
@@ -75,8 +165,8 @@ def register():
     if request.method == 'POST':
         # Get form data
         full_name = request.form.get('full_name')
-        mobile = request.form.get('mobile')
-        email = request.form.get('email')
+        mobile = User.normalize_mobile(request.form.get('mobile'))
+        email = User.normalize_email(request.form.get('email'))
         location = request.form.get('location')
         latitude = request.form.get('latitude')
         longitude = request.form.get('longitude')
@@ -93,7 +183,8 @@ def register():
             flash('Mobile number already registered!', 'error')
             return redirect(url_for('register'))
         
-        if User.query.filter_by(email=email).first():
+        # Same comparison as the case-insensitive ix_users_email_lower
+        if User.query.filter(db.func.lower(User.email) == email).first():
             flash('Email already registered!', 'error')
             return redirect(url_for('register'))
         
@@ -104,9 +195,6 @@ def register():
             if file.filename != '':
                 profile_pic = save_profile_pic(file)
         
-        # Hash password
-        hashed_password = generate_password_hash(password)
-        
         # Create new user
         new_user = User(
             full_name=full_name,
@@ -115,7 +203,7 @@ def register():
             location=location,
             latitude=latitude,
             longitude=longitude,
-            password=hashed_password,
+            password=password,
             profile_pic=profile_pic
         )
         
@@ -130,15 +218,19 @@ def register():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        mobile = request.form.get('mobile')
+        mobile = User.normalize_mobile(request.form.get('mobile'))
         password = request.form.get('password')
         
         user = User.query.filter_by(mobile=mobile).first()
         
-        if user and check_password_hash(user.password, password):
+        if user and user.verify_password(password):
+            # Upgrade legacy pbkdf2 or outdated argon2 hashes while we have the plaintext
+            if user.needs_rehash():
+                user.password = password
+                db.session.commit()
             session['user_id'] = user.id
-            session['user_name'] = user.full_name
-            session['profile_pic'] = user.profile_pic
+            session['user'] = session_user(user)
+            session.pop('cart_count', None)
             flash('Login successful!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -155,47 +247,46 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    user = User.query.get(session['user_id'])
-    return render_template('dashboard.html', user=user)
+    return render_template('dashboard.html')
 
 @app.route('/services')
 @login_required
 def services():
-    active_services = Service.query.filter_by(status='active').all()
+    active_services = get_active_services()
     return render_template('service.html', services=active_services)
 
 @app.route('/menu')
 @login_required
 def menu():
-    active_menu = Menu.query.filter_by(status='active').all()
+    active_menu = get_active_menu()
     return render_template('menu.html', menu_items=active_menu)
 
 @app.route('/add_to_cart', methods=['POST'])
 @login_required
 def add_to_cart():
     item_type = request.form.get('item_type')
-    item_id = request.form.get('item_id')
-    quantity = request.form.get('quantity', 1)
+    if item_type not in ITEM_TYPES:
+        return jsonify({'error': 'Invalid item type'}), 400
+    item_id = int(request.form.get('item_id'))
+    quantity = int(request.form.get('quantity', 1))
     
-    # Check if item already in cart
-    existing = Cart.query.filter_by(
+    # Insert the row, or add to its quantity if the item is already in the cart
+    dialect_insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    stmt = dialect_insert(Cart).values(
         user_id=session['user_id'],
         item_type=item_type,
-        item_id=item_id
-    ).first()
-    
-    if existing:
-        existing.quantity += int(quantity)
-    else:
-        new_item = Cart(
-            user_id=session['user_id'],
-            item_type=item_type,
-            item_id=item_id,
-            quantity=quantity
-        )
-        db.session.add(new_item)
-    
+        item_id=item_id,
+        quantity=quantity
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'item_type', 'item_id'],
+        set_={'quantity': Cart.quantity + stmt.excluded.quantity}
+    )
+    db.session.execute(stmt)
     db.session.commit()
+    
+    # The upsert doesn't say whether a row was added; recount on next render
+    session.pop('cart_count', None)
     return jsonify({'success': True})
 
 @app.route('/cart')
@@ -207,10 +298,7 @@ def cart():
     total_amount = 0
     
     for item in cart_items:
-        if item.item_type == 'service':
-            product = Service.query.get(item.item_id)
-        else:
-            product = Menu.query.get(item.item_id)
+        product = item.product
         
         if product:
             item_total = product.final_price * item.quantity
@@ -233,6 +321,8 @@ def remove_from_cart(item_id):
     if item and item.user_id == session['user_id']:
         db.session.delete(item)
         db.session.commit()
+        if session.get('cart_count'):
+            session['cart_count'] -= 1
         flash('Item removed from cart!', 'success')
     return redirect(url_for('cart'))
 
@@ -240,7 +330,10 @@ def remove_from_cart(item_id):
 @login_required
 def checkout():
     user = User.query.get(session['user_id'])
-    return render_template('order_form.html', user=user)
+    cart_items = Cart.query.filter_by(user_id=user.id).all()
+    total_amount = cart_total(cart_items)
+    
+    return render_template('order_form.html', user=user, total_amount=total_amount)
 
 @app.route('/place_order', methods=['POST'])
 @login_required
@@ -249,6 +342,10 @@ def place_order():
     delivery_location = request.form.get('delivery_location')
     payment_mode = request.form.get('payment_mode')
     
+    if payment_mode not in PAYMENT_MODES:
+        flash('Please select a valid payment mode!', 'error')
+        return redirect(url_for('checkout'))
+    
     # Get cart items
     cart_items = Cart.query.filter_by(user_id=user_id).all()
     
@@ -257,15 +354,7 @@ def place_order():
         return redirect(url_for('cart'))
     
     # Calculate total amount
-    total_amount = 0
-    for item in cart_items:
-        if item.item_type == 'service':
-            product = Service.query.get(item.item_id)
-        else:
-            product = Menu.query.get(item.item_id)
-        
-        if product:
-            total_amount += product.final_price * item.quantity
+    total_amount = cart_total(cart_items)
     
     # Create order
     new_order = Order(
@@ -278,27 +367,27 @@ def place_order():
     db.session.add(new_order)
     db.session.flush()  # Get order ID
     
-    # Add order items
-    for item in cart_items:
-        if item.item_type == 'service':
-            product = Service.query.get(item.item_id)
-        else:
-            product = Menu.query.get(item.item_id)
-        
-        if product:
-            order_item = OrderItem(
-                order_id=new_order.id,
-                item_type=item.item_type,
-                item_id=item.item_id,
-                quantity=item.quantity,
-                price=product.final_price
-            )
-            db.session.add(order_item)
+    # Add order items in one executemany
+    order_items = [
+        {
+            'order_id': new_order.id,
+            'item_type': item.item_type,
+            'item_id': item.item_id,
+            'quantity': item.quantity,
+            'price': item.product.final_price,
+            'item_name': item.product.name,
+            'item_photo': item.product.photo
+        }
+        for item in cart_items if item.product
+    ]
+    if order_items:
+        db.session.execute(insert(OrderItem), order_items)
     
     # Clear cart
-    Cart.query.filter_by(user_id=user_id).delete()
+    Cart.query.filter_by(user_id=user_id).delete(synchronize_session=False)
     
     db.session.commit()
+    session['cart_count'] = 0
     
     flash('Order placed successfully!', 'success')
     return redirect(url_for('order_history'))
@@ -306,7 +395,7 @@ def place_order():
 @app.route('/order_history')
 @login_required
 def order_history():
-    orders = Order.query.filter_by(user_id=session['user_id']).order_by(Order.order_date.desc()).all()
+    orders = Order.query.filter_by(user_id=session['user_id']).order_by(Order.order_date.desc(), Order.id.desc()).all()
     return render_template('order_history.html', orders=orders)
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -323,28 +412,31 @@ def profile():
         # Handle password change
         new_password = request.form.get('new_password')
         if new_password:
-            user.password = generate_password_hash(new_password)
+            user.password = new_password
         
         # Handle profile picture update
         if 'profile_pic' in request.files:
             file = request.files['profile_pic']
             if file.filename != '':
-                # Delete old picture if exists
-                if user.profile_pic:
-                    old_path = os.path.join(app.config['UPLOAD_FOLDER'], user.profile_pic)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                
                 # Save new picture
                 new_pic = save_profile_pic(file)
+                old_pic = user.profile_pic
                 if new_pic:
                     user.profile_pic = new_pic
+                
+                # Delete old picture unless another user uploaded the same image
+                if new_pic and old_pic and old_pic is not new_pic:
+                    shared = User.query.filter(User.profile_pic_id == old_pic.id, User.id != user.id).first()
+                    if not shared:
+                        old_path = os.path.join(app.config['UPLOAD_FOLDER'], old_pic.filename)
+                        if os.path.exists(old_path):
+                            os.remove(old_path)
+                        db.session.delete(old_pic)
         
         db.session.commit()
         
         # Update session
-        session['user_name'] = user.full_name
-        session['profile_pic'] = user.profile_pic
+        session['user'] = session_user(user)
         
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
@@ -356,17 +448,17 @@ def profile():
 @login_required
 def get_item_details(item_type, item_id):
     if item_type == 'service':
-        item = Service.query.get(item_id)
+        item = Service.query.options(undefer(Service.short_description)).get(item_id)
     else:
-        item = Menu.query.get(item_id)
+        item = Menu.query.options(undefer(Menu.description)).get(item_id)
     
     if item:
         return jsonify({
             'name': item.name,
             'photo': item.photo,
-            'original_price': item.original_price,
-            'discount': item.discount,
-            'final_price': item.final_price,
+            'original_price': float(item.original_price),
+            'discount': float(item.discount),
+            'final_price': float(item.final_price),
             'description': item.short_description if hasattr(item, 'short_description') else item.description
         })
     
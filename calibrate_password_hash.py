@@ -0,0 +1,54 @@
+"""Pick ARGON2_TIME_COST for this machine.
+
+Run on the production host:  python calibrate_password_hash.py --target-ms 350
+then export the suggested ARGON2_* values into the app's environment.
+"""
+import argparse
+import statistics
+import time
+
+from argon2 import PasswordHasher
+
+
+def time_hash(hasher, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.hash('calibration-password')
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target-ms', type=float, default=350,
+                        help='hash time to aim for, in milliseconds (default: 350)')
+    parser.add_argument('--memory-cost', type=int, default=46 * 1024,
+                        help='argon2 memory cost in KiB (default: 47104)')
+    parser.add_argument('--parallelism', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='hashes timed per setting (default: 5)')
+    args = parser.parse_args()
+
+    chosen = None
+    for time_cost in range(1, 11):
+        hasher = PasswordHasher(time_cost=time_cost, memory_cost=args.memory_cost,
+                                parallelism=args.parallelism)
+        elapsed = time_hash(hasher, args.rounds)
+        print(f'time_cost={time_cost:2d}  {elapsed:7.1f} ms')
+        if elapsed > args.target_ms:
+            break
+        chosen = time_cost
+
+    if chosen is None:
+        print('Even time_cost=1 exceeds the target; lower --memory-cost.')
+        return
+
+    print()
+    print(f'ARGON2_TIME_COST={chosen}')
+    print(f'ARGON2_MEMORY_COST={args.memory_cost}')
+    print(f'ARGON2_PARALLELISM={args.parallelism}')
+
+
+if __name__ == '__main__':
+    main()
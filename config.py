@@ -1,26 +1,63 @@
 import os
 from datetime import timedelta
+import redis
+from sqlalchemy.engine import make_url
+
+def engine_options(database_uri):
+    url = make_url(database_uri)
+    
+    # Room in the compiled-statement cache for every query shape the app uses
+    options = {'query_cache_size': 1200}
+    
+    # Connection pool for a networked database; SQLite keeps the driver defaults
+    if url.get_backend_name() != 'sqlite':
+        options.update({
+            'pool_size': 20,
+            'max_overflow': 10,
+            'pool_pre_ping': True,
+            'pool_recycle': 1800,
+            'pool_use_lifo': True
+        })
+    
+    # psycopg2 folds executemany() into multi-row VALUES plus execute_batch
+    if url.get_dialect().driver == 'psycopg2':
+        options['executemany_mode'] = 'values_plus_batch'
+    
+    return options
 
 class Config:
     # Security
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    # Same fallback app.py used before it loaded Config, so existing sessions stay valid
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
     
     # Database
     basedir = os.path.abspath(os.path.dirname(__file__))
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///' + os.path.join(basedir, 'user_app.db')
+    # Relative sqlite paths resolve inside the Flask instance folder
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///user_app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    
+    # Password hashing (argon2id); calibrate with calibrate_password_hash.py
+    ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 3))
+    ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 46 * 1024))  # KiB
+    ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 2))
     
     # Session
-    SESSION_TYPE = 'filesystem'
+    SESSION_TYPE = 'redis'
+    SESSION_PERMANENT = False
+    SESSION_USE_SIGNER = True
+    SESSION_REDIS = redis.from_url(os.environ.get('REDIS_URL') or 'redis://localhost:6379/0')
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     
     # File Uploads
-    UPLOAD_FOLDER = os.path.join(basedir, 'static/uploads')
+    UPLOAD_FOLDER = os.path.join(basedir, 'static/uploads/profile_pics')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     
     # Allowed extensions
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    ALLOWED_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'webp'})
+    
+    # Seconds the active services/menu lists are cached per worker
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 60))
     
     # Image sizes
     PROFILE_PIC_SIZE = (300, 300)
@@ -29,4 +66,5 @@ class Config:
     
     # App config
     APP_NAME = "User Service App"
-    DEBUG = os.environ.get('FLASK_DEBUG') or True
\ No newline at end of file
+    # Off unless FLASK_DEBUG is set; app.run(debug=True) still turns it on locally
+    DEBUG = os.environ.get('FLASK_DEBUG', '').lower() not in ('', '0', 'false', 'no')
\ No newline at end of file
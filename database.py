@@ -1,78 +1,233 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import deferred, validates
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from functools import lru_cache
+import sqlite3
 
 db = SQLAlchemy()
 
+ITEM_TYPES = ('service', 'menu')
+PAYMENT_MODES = ('COD', 'UPI', 'Card')
+
+# Money is stored as exact decimals; closed sets the app owns as enums the database enforces.
+# Catalog and order status stay plain strings: the admin side writes those.
+Money = db.Numeric(10, 2)
+ItemType = db.Enum(*ITEM_TYPES, name='item_type_enum', create_constraint=True, validate_strings=True)
+PaymentMode = db.Enum(*PAYMENT_MODES, name='payment_mode_enum', create_constraint=True, validate_strings=True)
+
+@lru_cache(maxsize=None)
+def _hasher_for(time_cost, memory_cost, parallelism):
+    return PasswordHasher(time_cost=time_cost, memory_cost=memory_cost,
+                          parallelism=parallelism, hash_len=32, salt_len=16)
+
+def password_hasher():
+    # Cost comes from ARGON2_* config so it can be raised without a code change
+    config = current_app.config
+    return _hasher_for(config['ARGON2_TIME_COST'], config['ARGON2_MEMORY_COST'],
+                       config['ARGON2_PARALLELISM'])
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragma(dbapi_con, connection_record):
+    # WAL lets readers run alongside the single writer; mmap speeds up reads
+    if not isinstance(dbapi_con, sqlite3.Connection):
+        return
+    cursor = dbapi_con.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA mmap_size=134217728')
+    cursor.close()
+
 class User(db.Model):
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
-    profile_pic = db.Column(db.String(200), nullable=True)
+    profile_pic_id = db.Column(db.Integer, db.ForeignKey('assets.id'), nullable=True)
     full_name = db.Column(db.String(100), nullable=False)
     mobile = db.Column(db.String(15), unique=True, nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     location = db.Column(db.String(200), nullable=False)
     latitude = db.Column(db.String(50), nullable=True)
     longitude = db.Column(db.String(50), nullable=True)
-    password = db.Column(db.String(200), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    password_hash = db.Column('password', db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+    
+    # Relationships (iterate orders with .options(selectinload(User.orders)))
+    profile_pic = db.relationship('Asset', lazy='joined')
+    cart_items = db.relationship('Cart', back_populates='user', cascade='all, delete-orphan')
+    orders = db.relationship('Order', back_populates='user')
+    
+    @staticmethod
+    def normalize_email(email):
+        return email.strip().lower() if email else email
+    
+    @staticmethod
+    def normalize_mobile(mobile):
+        return ''.join(ch for ch in mobile if ch.isdigit()) if mobile else mobile
+    
+    # Store normalised values so login lookups hit the unique indexes directly
+    @validates('email')
+    def validate_email(self, key, email):
+        return self.normalize_email(email)
+    
+    @validates('mobile')
+    def validate_mobile(self, key, mobile):
+        return self.normalize_mobile(mobile)
+    
+    @property
+    def password(self):
+        raise AttributeError('password is write-only')
+    
+    @password.setter
+    def password(self, password):
+        self.password_hash = password_hasher().hash(password)
+    
+    def verify_password(self, password):
+        # Accounts created before the switch to argon2 still carry werkzeug pbkdf2 hashes
+        if not self.password_hash.startswith('$argon2'):
+            return check_password_hash(self.password_hash, password)
+        try:
+            return password_hasher().verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    
+    def needs_rehash(self):
+        return (not self.password_hash.startswith('$argon2')
+                or password_hasher().check_needs_rehash(self.password_hash))
+
+class Asset(db.Model):
+    __tablename__ = 'assets'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)  # relative to UPLOAD_FOLDER
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+
+# Guards against mixed-case duplicates left over from before normalisation
+db.Index('ix_users_email_lower', db.func.lower(User.email), unique=True)
 
 class Service(db.Model):
     __tablename__ = 'services'
+    __table_args__ = (
+        # Catalog pages only ever read active rows, sorted by price
+        db.Index('ix_services_active', 'final_price',
+                 postgresql_where=db.text("status = 'active'"),
+                 sqlite_where=db.text("status = 'active'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     photo = db.Column(db.String(200), nullable=True)
-    original_price = db.Column(db.Float, nullable=False)
-    discount = db.Column(db.Float, default=0)
-    final_price = db.Column(db.Float, nullable=False)
-    short_description = db.Column(db.Text, nullable=True)
+    original_price = db.Column(Money, nullable=False)
+    discount = db.Column(db.Numeric(5, 2), nullable=False, default=0, server_default='0')  # percent
+    final_price = db.Column(Money, db.Computed('original_price * (1 - discount / 100.0)', persisted=True))
+    short_description = deferred(db.Column(db.Text, nullable=True))
     status = db.Column(db.String(20), default='active')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
 
 class Menu(db.Model):
     __tablename__ = 'menu_items'
+    __table_args__ = (
+        # Catalog pages only ever read active rows, sorted by price
+        db.Index('ix_menu_items_active', 'final_price',
+                 postgresql_where=db.text("status = 'active'"),
+                 sqlite_where=db.text("status = 'active'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     photo = db.Column(db.String(200), nullable=True)
-    original_price = db.Column(db.Float, nullable=False)
-    discount = db.Column(db.Float, default=0)
-    final_price = db.Column(db.Float, nullable=False)
-    description = db.Column(db.Text, nullable=True)
+    original_price = db.Column(Money, nullable=False)
+    discount = db.Column(db.Numeric(5, 2), nullable=False, default=0, server_default='0')  # percent
+    final_price = db.Column(Money, db.Computed('original_price * (1 - discount / 100.0)', persisted=True))
+    description = deferred(db.Column(db.Text, nullable=True))
     status = db.Column(db.String(20), default='active')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
 
 class Cart(db.Model):
     __tablename__ = 'cart'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'item_type', 'item_id', name='uq_cart_key'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    item_type = db.Column(db.String(10), nullable=False)  # 'service' or 'menu'
+    item_type = db.Column(ItemType, nullable=False)
     item_id = db.Column(db.Integer, nullable=False)
     quantity = db.Column(db.Integer, default=1)
-    added_at = db.Column(db.DateTime, default=datetime.utcnow)
+    added_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+    
+    user = db.relationship('User', back_populates='cart_items')
+    
+    # Relationships (item_id points at services or menu_items depending on item_type)
+    service = db.relationship(
+        'Service',
+        primaryjoin="and_(Cart.item_type == 'service', foreign(Cart.item_id) == Service.id)",
+        viewonly=True,
+        lazy='joined'
+    )
+    menu = db.relationship(
+        'Menu',
+        primaryjoin="and_(Cart.item_type == 'menu', foreign(Cart.item_id) == Menu.id)",
+        viewonly=True,
+        lazy='joined'
+    )
+    
+    @property
+    def product(self):
+        return self.service if self.item_type == 'service' else self.menu
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_user_date', 'user_id', 'order_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    total_amount = db.Column(db.Float, nullable=False)
-    payment_mode = db.Column(db.String(20), nullable=False)
+    total_amount = db.Column(Money, nullable=False)
+    payment_mode = db.Column(PaymentMode, nullable=False)
     delivery_location = db.Column(db.String(500), nullable=False)
-    order_date = db.Column(db.DateTime, default=datetime.utcnow)
+    order_date = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
     order_status = db.Column(db.String(20), default='Pending')
     
-    # Relationship
-    items = db.relationship('OrderItem', backref='order', lazy=True)
+    # Relationships
+    user = db.relationship('User', back_populates='orders')
+    items = db.relationship('OrderItem', back_populates='order', lazy='selectin')
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    item_type = db.Column(db.String(10), nullable=False)  # 'service' or 'menu'
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    item_type = db.Column(ItemType, nullable=False)
     item_id = db.Column(db.Integer, nullable=False)
     quantity = db.Column(db.Integer, default=1)
-    price = db.Column(db.Float, nullable=False)
\ No newline at end of file
+    price = db.Column(Money, nullable=False)
+    # Snapshot of the catalog row at order time, so history never needs services/menu_items
+    item_name = db.Column(db.String(100), nullable=False)
+    item_photo = db.Column(db.String(200), nullable=True)
+    
+    order = db.relationship('Order', back_populates='items')
+    
+    # Relationships to the live catalog row, which may since have changed or gone
+    service = db.relationship(
+        'Service',
+        primaryjoin="and_(OrderItem.item_type == 'service', foreign(OrderItem.item_id) == Service.id)",
+        viewonly=True
+    )
+    menu = db.relationship(
+        'Menu',
+        primaryjoin="and_(OrderItem.item_type == 'menu', foreign(OrderItem.item_id) == Menu.id)",
+        viewonly=True
+    )
+    
+    @property
+    def product(self):
+        return self.service if self.item_type == 'service' else self.menu
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""Upgrade a database created by the original schema to the current models.
+
+Run once, with the app stopped and after taking a backup:  python upgrade_schema.py
+It reads every row, recreates the tables from database.py and copies the rows
+back in one transaction, so a failure leaves the database untouched.
+"""
+import hashlib
+import os
+from datetime import timezone
+
+from flask import Flask
+from PIL import Image
+from sqlalchemy import MetaData, event, inspect, select, text
+
+from config import Config
+from database import db, Asset, User, Service, Menu, Cart, Order, OrderItem
+
+# Columns the original schema wrote from Python-side defaults
+TIMESTAMP_COLUMNS = {'users': 'created_at', 'services': 'created_at', 'menu_items': 'created_at',
+                     'cart': 'added_at', 'orders': 'order_date'}
+
+
+def utc(value):
+    # The original schema stored naive datetime.utcnow() values
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def build_assets(users, upload_folder):
+    """Create one Asset row per distinct picture file; return rows and filename -> id."""
+    assets, by_sha, asset_ids, missing = [], {}, {}, []
+    for filename in sorted({user['profile_pic'] for user in users if user['profile_pic']}):
+        path = os.path.join(upload_folder, filename)
+        if not os.path.exists(path):
+            missing.append(filename)
+            continue
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if digest not in by_sha:
+            with Image.open(path) as img:
+                width, height = img.size
+            by_sha[digest] = len(assets) + 1
+            assets.append({'id': by_sha[digest], 'filename': filename, 'sha256': digest,
+                           'width': width, 'height': height})
+        asset_ids[filename] = by_sha[digest]
+    if missing:
+        print(f'{len(missing)} profile picture(s) not found in {upload_folder}; those users lose theirs')
+    return assets, asset_ids
+
+
+def product_snapshots(rows):
+    return {(item_type, row['id']): row
+            for item_type, table in (('service', 'services'), ('menu', 'menu_items'))
+            for row in rows.get(table, [])}
+
+
+def merge_cart(cart):
+    # uq_cart_key allows one row per (user_id, item_type, item_id); fold duplicates into the first
+    merged = {}
+    for row in sorted(cart, key=lambda row: row['id']):
+        key = (row['user_id'], row['item_type'], row['item_id'])
+        if key in merged:
+            merged[key]['quantity'] = (merged[key]['quantity'] or 1) + (row['quantity'] or 1)
+        else:
+            merged[key] = row
+    return list(merged.values())
+
+
+def transform(rows, upload_folder):
+    users = rows['users']
+    assets, asset_ids = build_assets(users, upload_folder)
+    for user in users:
+        user['profile_pic_id'] = asset_ids.get(user.pop('profile_pic'))
+        # Login and registration look up the normalised forms
+        user['email'] = User.normalize_email(user['email'])
+        user['mobile'] = User.normalize_mobile(user['mobile'])
+
+    for table in ('services', 'menu_items'):
+        for row in rows.get(table, []):
+            # final_price is now generated from these two columns
+            row.pop('final_price', None)
+            if row['discount'] is None:
+                row['discount'] = 0
+
+    products = product_snapshots(rows)
+    for item in rows.get('order_items', []):
+        product = products.get((item['item_type'], item['item_id']))
+        # Best available snapshot: the catalog row as it is now, if it still exists
+        item['item_name'] = product['name'] if product else f"{item['item_type']} #{item['item_id']}"
+        item['item_photo'] = product['photo'] if product else None
+
+    rows['cart'] = merge_cart(rows.get('cart', []))
+
+    for table, column in TIMESTAMP_COLUMNS.items():
+        for row in rows.get(table, []):
+            # NULL would fail the new NOT NULL; let the server default fill it in
+            if row[column] is None:
+                del row[column]
+            else:
+                row[column] = utc(row[column])
+
+    rows['assets'] = assets
+    return rows
+
+
+def check_enums(rows):
+    # Values outside ITEM_TYPES/PAYMENT_MODES would fail the new enum constraints
+    bad = []
+    for model in (Cart, Order, OrderItem):
+        table = model.__table__
+        for column in table.columns:
+            allowed = getattr(column.type, 'enums', None)
+            if not allowed:
+                continue
+            bad += [(table.name, row['id'], column.name, row[column.name])
+                    for row in rows.get(table.name, []) if row[column.name] not in allowed]
+    return bad
+
+
+def check_duplicates(users):
+    # Accounts that differ only in case, spacing or punctuation collide once normalised
+    bad = []
+    for column in ('email', 'mobile'):
+        seen = {}
+        for user in users:
+            seen.setdefault(user[column], []).append(user['id'])
+        bad += [(column, value, ids) for value, ids in seen.items() if len(ids) > 1]
+    return bad
+
+
+def upgrade(conn, upload_folder):
+    existing = set(inspect(conn).get_table_names())
+    if 'users' not in existing:
+        print('No users table; the app creates the current schema on start.')
+        return
+    if 'profile_pic' not in {column['name'] for column in inspect(conn).get_columns('users')}:
+        print('Schema is already current.')
+        return
+
+    old = MetaData()
+    old.reflect(conn, only=[name for name in db.metadata.tables if name in existing])
+    rows = {name: [dict(row) for row in conn.execute(select(table)).mappings()]
+            for name, table in old.tables.items() if name != 'assets'}
+    rows = transform(rows, upload_folder)
+
+    bad = [f'{table} id={row_id}: {column}={value!r}' for table, row_id, column, value in check_enums(rows)]
+    bad += [f'users ids {ids}: share {column} {value!r}' for column, value, ids in check_duplicates(rows['users'])]
+    if bad:
+        print('\n'.join(bad))
+        raise SystemExit('Fix the rows above, then run the upgrade again.')
+
+    old.drop_all(conn)
+    db.metadata.create_all(conn)
+    for model in (Asset, User, Service, Menu, Cart, Order, OrderItem):
+        table = model.__table__
+        table_rows = rows.get(table.name)
+        if not table_rows:
+            continue
+        # Rows without a timestamp take the server default, so insert them separately
+        for has_column in (True, False):
+            batch = [row for row in table_rows
+                     if (TIMESTAMP_COLUMNS.get(table.name) in row) is has_column]
+            if batch:
+                conn.execute(table.insert(), batch)
+        print(f'{table.name}: {len(table_rows)} rows')
+
+        # Ids were copied explicitly, so move each sequence past them
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), MAX(id)) FROM {table.name}"))
+
+
+def main():
+    # A bare app, so app.py's create_all() doesn't touch the old tables first
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            # pysqlite only opens a transaction before DML; begin explicitly so the DDL rolls back too
+            event.listen(db.engine, 'connect', lambda dbapi_con, record: setattr(dbapi_con, 'isolation_level', None))
+            event.listen(db.engine, 'begin', lambda conn: conn.exec_driver_sql('BEGIN'))
+        with db.engine.begin() as conn:
+            upgrade(conn, app.config['UPLOAD_FOLDER'])
+
+
+if __name__ == '__main__':
+    main()